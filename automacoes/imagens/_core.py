@@ -0,0 +1,384 @@
+"""
+Núcleo da compressão para um tamanho alvo, usado pelos scripts desta pasta.
+Exige Pillow (pip install Pillow).
+Opcional: cykooz.resizer (pip install cykooz.resizer) para redimensionar com SIMD.
+Opcional: mozjpeg (pip install mozjpeg-lossless-optimization), ligado com mozjpeg=True,
+recomprime sem perdas o JPEG final e usa a folga para subir a qualidade.
+
+"""
+
+import io
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+try:
+    from cykooz_resizer import FilterType, ResizeAlg, ResizeOptions, Resizer
+except ImportError:
+    Resizer = None
+
+try:
+    import mozjpeg_lossless_optimization
+except ImportError:
+    mozjpeg_lossless_optimization = None
+
+Image.MAX_IMAGE_PIXELS = None
+
+# libjpeg/libwebp soltam o GIL durante o encode, então threads escalam
+_MAX_WORKERS = min(4, os.cpu_count() or 1)
+_BATCH = 3
+
+# buffers de encode reaproveitados entre passadas (e entre imagens no --batch);
+# um conjunto por thread chamadora, para compress_to_target seguir thread-safe
+_ENCODE_BUFS = threading.local()
+
+# formatos em que o Pillow usa o parâmetro quality; nos demais toda tentativa
+# da busca geraria o mesmo arquivo
+_QUALITY_FORMATS = frozenset({"JPEG", "WEBP", "AVIF"})
+
+if Resizer is not None:
+    _RESIZER = Resizer()
+    _RESIZE_OPTIONS = ResizeOptions(resize_alg=ResizeAlg.convolution(FilterType.lanczos3))
+
+
+def load_image(path: Path, max_width: int | None = None) -> Image.Image:
+    img = Image.open(path)
+    if max_width and img.format == "JPEG" and img.width > max_width:
+        # o libjpeg decodifica direto em 1/2, 1/4 ou 1/8 do tamanho, sem
+        # passar pela resolução cheia; a altura proporcional evita que uma
+        # foto deitada fique presa numa escala menor por causa da altura
+        img.draft("RGB", (max_width, math.ceil(img.height * max_width / img.width)))
+    if img.mode == "P":
+        img = img.convert("RGBA")
+    return img
+
+
+def ensure_mode_for_format(img: Image.Image, fmt: str) -> Image.Image:
+    fmt = fmt.upper()
+    if fmt in ("JPEG", "JPG"):
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            if img.mode == "P":
+                img = img.convert("RGBA")
+            bg.paste(img, mask=img.getchannel("A"))
+            return bg
+        if img.mode not in ("RGB",):
+            return img.convert("RGB")
+    elif fmt == "WEBP":
+        pass
+    else:
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    return img
+
+
+def resolve_save_kwargs(fmt: str, save_kwargs: dict) -> tuple[str, dict]:
+    # junta os padrões de cada formato uma vez só, fora do laço de busca
+    if "quality" in save_kwargs:
+        # quem escolhe a qualidade é a busca; limite com quality_min/quality_max
+        raise ValueError("quality é definida pela busca; use quality_min/quality_max")
+    fmt_u = fmt.upper()
+    if fmt_u in ("JPEG", "JPG"):
+        return "JPEG", {"optimize": True, "progressive": True, **save_kwargs}
+    if fmt_u == "WEBP":
+        return "WEBP", {"method": 6, "lossless": False, **save_kwargs}
+    return fmt_u, dict(save_kwargs)
+
+
+def encode_buffers(n: int) -> list:
+    bufs = getattr(_ENCODE_BUFS, "bufs", None)
+    if bufs is None:
+        bufs = _ENCODE_BUFS.bufs = [io.BytesIO() for _ in range(n)]
+    return bufs
+
+
+def buffer_bytes(buf: io.BytesIO, size: int) -> bytes:
+    # o buffer pode ter sobras de um encode anterior maior depois de size
+    with buf.getbuffer() as view:
+        return view[:size].tobytes()
+
+
+def bytes_of_save(img: Image.Image, fmt: str, buf: io.BytesIO, quality: int, resolved_kwargs: dict) -> int:
+    # fmt e resolved_kwargs vêm de resolve_save_kwargs; escreve por cima do
+    # buffer do chamador e devolve só o tamanho, os bytes saem com
+    # buffer_bytes(buf, tamanho). Sem truncate(): ele devolve a memória e o
+    # próximo encode teria que crescer o buffer de novo
+    buf.seek(0)
+    img.save(buf, format=fmt, quality=quality, **resolved_kwargs)
+    return buf.tell()
+
+
+def probe_batch(slots: list, fmt: str, qualities, cache: dict, executor, resolved_kwargs: dict) -> dict:
+    # cada encode simultâneo usa sua própria cópia (save() grava encoderinfo na
+    # imagem) e seu próprio buffer; devolve quality -> buffer dos recém-codificados
+    pending = [q for q in dict.fromkeys(qualities) if q not in cache]
+    futures = [(q, buf, executor.submit(bytes_of_save, view, fmt, buf, q, resolved_kwargs)) for q, (view, buf) in zip(pending, slots)]
+    encoded = {}
+    for q, buf, fut in futures:
+        cache[q] = fut.result()
+        encoded[q] = buf
+    return encoded
+
+
+def encoded_bytes(slots: list, fmt: str, q: int, encoded: dict, cache: dict, resolved_kwargs: dict) -> bytes:
+    # q que veio de um cache reaproveitado só tem o tamanho, não os bytes:
+    # codifica de novo no primeiro slot, que o chamador já não está lendo
+    if q in encoded:
+        return buffer_bytes(encoded[q], cache[q])
+    view, buf = slots[0]
+    return buffer_bytes(buf, bytes_of_save(view, fmt, buf, q, resolved_kwargs))
+
+
+def next_qualities(lo: int, hi: int) -> list[int]:
+    # um candidato por worker: com um núcleo só vira busca binária pura, que
+    # gasta menos encodes que lotes de 3
+    width = min(_BATCH, _MAX_WORKERS)
+    n = hi - lo + 1
+    return sorted({lo + n * i // (width + 1) for i in range(1, width + 1)})
+
+
+def narrow_bounds(lo: int, hi: int, qualities: list[int], cache: dict, target_bytes: int) -> tuple[int, int, int | None]:
+    # tamanho cresce com a qualidade: o maior q que cabe sobe lo, o primeiro
+    # que estoura desce hi
+    fit = None
+    for q in qualities:
+        if cache[q] <= target_bytes:
+            fit = q
+            lo = q + 1
+        else:
+            hi = q - 1
+            break
+    return lo, hi, fit
+
+
+def estimate_quality(cache: dict, target_bytes: int, damp_fit: int = 0, damp_over: int = 0) -> float | None:
+    # regula falsi em log(tamanho) ~ a*log(q) + b entre a sondagem que cabe
+    # com maior q e a que estoura com menor q; sem os dois lados ainda,
+    # extrapola pelas duas sondagens mais próximas do alvo. damp_* é o passo
+    # de Illinois: cada rodada em que um lado ficou parado divide por 2 a
+    # distância dele ao alvo, para a estimativa não ficar presa num lado só
+    fits = [q for q, size in cache.items() if size <= target_bytes]
+    overs = [q for q, size in cache.items() if size > target_bytes]
+    if fits and overs:
+        q_a, q_b = max(fits), min(overs)
+        f_a = math.log(cache[q_a] / target_bytes) / 2 ** damp_fit
+        f_b = math.log(cache[q_b] / target_bytes) / 2 ** damp_over
+    elif len(cache) >= 2:
+        q_a, q_b = sorted(cache, key=lambda q: abs(math.log(cache[q] / target_bytes)))[:2]
+        f_a, f_b = math.log(cache[q_a] / target_bytes), math.log(cache[q_b] / target_bytes)
+    else:
+        return None
+    if f_a == f_b:
+        return None
+    slope = (f_b - f_a) / math.log(q_b / q_a)
+    if slope <= 0:
+        return None
+    # em log para não estourar o exp(): sondagens quase do mesmo tamanho (imagem
+    # chapada) dão inclinação ~0, e uma estimativa acima de 100 não serve mesmo
+    log_ratio = -f_a / slope
+    if log_ratio > math.log(100 / q_a):
+        return None
+    return q_a * math.exp(log_ratio)
+
+
+def bisect_quality(slots: list, fmt: str, target_bytes: int, lo: int, hi: int, max_iters: int, cache: dict, executor, resolved_kwargs: dict, best=None):
+    for _ in range(max_iters):
+        if lo > hi:
+            break
+        qs = next_qualities(lo, hi)
+        encoded = probe_batch(slots, fmt, qs, cache, executor, resolved_kwargs)
+        lo, hi, fit = narrow_bounds(lo, hi, qs, cache, target_bytes)
+        if fit is not None and (best is None or fit > best[1]):
+            best = (encoded_bytes(slots, fmt, fit, encoded, cache, resolved_kwargs), fit)
+    return best, lo, hi
+
+
+def thread_views(img: Image.Image, n: int) -> list:
+    # uma imagem por encode simultâneo; nos modos que o Pillow mapeia direto
+    # sobre um buffer, as cópias compartilham um único bloco de pixels
+    img.load()
+    if _MAX_WORKERS == 1:
+        return [img] * n
+    if img.mode in ("L", "RGBA"):
+        pixels = img.tobytes()
+        return [img] + [Image.frombuffer(img.mode, img.size, pixels, "raw", img.mode, 0, 1) for _ in range(n - 1)]
+    return [img] + [img.copy() for _ in range(n - 1)]
+
+
+def binary_search_quality(img: Image.Image, fmt: str, target_bytes: int, q_min=5, q_max=95, max_iters=6, cache=None, **save_kwargs):
+
+    if cache is None:
+        cache = {}
+    fmt, resolved_kwargs = resolve_save_kwargs(fmt, save_kwargs)
+    if fmt not in _QUALITY_FORMATS:
+        buf = encode_buffers(_BATCH)[0]
+        cache[q_min] = bytes_of_save(img, fmt, buf, q_min, resolved_kwargs)
+        if cache[q_min] <= target_bytes:
+            return buffer_bytes(buf, cache[q_min]), q_min
+        return None, None
+    views = thread_views(img, _BATCH)
+    slots = list(zip(views, encode_buffers(_BATCH)))
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        return _search_quality(slots, fmt, target_bytes, q_min, q_max, max_iters, cache, executor, resolved_kwargs)
+
+
+def _search_quality(slots: list, fmt: str, target_bytes: int, q_min: int, q_max: int, max_iters: int, cache: dict, executor, resolved_kwargs: dict):
+    best = None
+    lo, hi = q_min, q_max
+
+    # a menos de 1 KB (ou 1% em alvos pequenos) do alvo não há o que ganhar
+    def close_enough():
+        return best is not None and cache[best[1]] >= target_bytes - min(1024, target_bytes // 100)
+
+    # duas sondagens iniciais; depois cada rodada interpola o q do alvo entre
+    # as sondagens que delimitam a resposta e testa só ele
+    qs = [q_min + (q_max - q_min) // 3, q_max - (q_max - q_min) // 4]
+    damp_fit = damp_over = 0
+    for _ in range(max_iters):
+        encoded = probe_batch(slots, fmt, qs, cache, executor, resolved_kwargs)
+        lo, hi, fit = narrow_bounds(lo, hi, qs, cache, target_bytes)
+        if fit is not None and (best is None or fit > best[1]):
+            best = (encoded_bytes(slots, fmt, fit, encoded, cache, resolved_kwargs), fit)
+        if lo > hi or close_enough():
+            break
+        if len(qs) == 1:
+            # o lado que não recebeu a sondagem nova ficou parado
+            damp_over, damp_fit = (damp_over + 1, 0) if fit is not None else (0, damp_fit + 1)
+        est = estimate_quality(cache, target_bytes, damp_fit, damp_over)
+        if est is None:
+            break
+        est = round(est)
+        # encostou na borda ou repetiu uma sondagem: a interpolação não
+        # avança mais, a busca binária termina o serviço
+        if est <= lo or est >= hi or est in cache:
+            break
+        qs = [est]
+
+    # a interpolação parou antes de fechar: busca binária no que sobrou do
+    # intervalo, com rodadas suficientes para fechá-lo
+    if lo <= hi and not close_enough():
+        best, _, _ = bisect_quality(slots, fmt, target_bytes, lo, hi, hi - lo + 1, cache, executor, resolved_kwargs, best)
+
+    if best is None:
+        encoded = probe_batch(slots, fmt, (q_min,), cache, executor, resolved_kwargs)
+        if cache[q_min] <= target_bytes:
+            return encoded_bytes(slots, fmt, q_min, encoded, cache, resolved_kwargs), q_min
+        return None, None
+    return best
+
+
+def scale_by_factor(img: Image.Image, factor: float) -> Image.Image:
+    w, h = img.size
+    new_w = max(1, int(w * factor))
+    new_h = max(1, int(h * factor))
+    if (new_w, new_h) == (w, h):
+        new_w = max(1, w - 1)
+        new_h = max(1, h - 1)
+    if Resizer is None or img.mode not in ("RGB", "RGBA", "L"):
+        # com reducing_gap=3.0 o Pillow só faz o reduce() inteiro antes do
+        # LANCZOS quando o fator é <= 1/6. As passadas ficam em [0.5, 0.95] e
+        # nunca chegam lá; só ajuda num --max-width grande de PNG/WEBP (JPEG
+        # já chega reduzido pelo draft() em load_image)
+        return img.resize((new_w, new_h), Image.LANCZOS, reducing_gap=3.0)
+    # resize_pil já pré-multiplica o alfa em imagens RGBA
+    dst = Image.new(img.mode, (new_w, new_h))
+    _RESIZER.resize_pil(img, dst, _RESIZE_OPTIONS)
+    return dst
+
+
+def mozjpeg_smaller(data: bytes) -> bytes:
+    optimized = mozjpeg_lossless_optimization.optimize(data, mozjpeg_lossless_optimization.COPY_MARKERS.ALL)
+    return optimized if len(optimized) < len(data) else data
+
+
+def mozjpeg_raise_quality(img: Image.Image, data: bytes, q: int, q_max: int, target_bytes: int, resolved_kwargs: dict) -> tuple[bytes, int]:
+    # o mozjpeg tira alguns % sem perdas; a folga que sobra no alvo vira
+    # qualidade, subindo q enquanto o arquivo otimizado ainda couber
+    best = (mozjpeg_smaller(data), q)
+    if len(best[0]) > target_bytes:
+        return best
+    buf = encode_buffers(_BATCH)[0]
+    for q in range(q + 1, q_max + 1):
+        size = bytes_of_save(img, "JPEG", buf, q, resolved_kwargs)
+        data = mozjpeg_smaller(buffer_bytes(buf, size))
+        if len(data) > target_bytes:
+            break
+        best = (data, q)
+    return best
+
+
+def compress_to_target(
+    input_path: Path,
+    output_path: Path,
+    target_kb: int = 70,
+    fmt: str = "JPEG",
+    max_width: int | None = None,
+    quality_min: int = 5,
+    quality_max: int = 95,
+    max_passes: int = 6,
+    mozjpeg: bool = False,
+    **save_kwargs,
+) -> tuple[Path, int, tuple[int, int], int]:
+    if mozjpeg and mozjpeg_lossless_optimization is None:
+        raise ImportError("mozjpeg=True exige pip install mozjpeg-lossless-optimization")
+    img = load_image(input_path, max_width=max_width)
+    fmt = fmt.upper()
+    img = ensure_mode_for_format(img, fmt)
+
+    if max_width is not None and img.width > max_width:
+        factor = max_width / float(img.width)
+        img = scale_by_factor(img, factor)
+
+    target_bytes = target_kb * 1024
+
+    # cache por imagem: quality -> tamanho; reinicia a cada redimensionamento
+    cache = {}
+    data, q_used = binary_search_quality(img, fmt, target_bytes, q_min=quality_min, q_max=quality_max, cache=cache, **save_kwargs)
+
+    passes = 0
+    cur_img = img
+    while data is None and passes < max_passes:
+        current_bytes = cache[quality_min]
+        factor = math.sqrt(target_bytes / current_bytes) * 0.98  
+        factor = min(factor, 0.95)
+        factor = max(factor, 0.5)
+        cur_img = scale_by_factor(cur_img, factor)
+        cache = {}
+        data, q_used = binary_search_quality(cur_img, fmt, target_bytes, q_min=quality_min, q_max=quality_max, cache=cache, **save_kwargs)
+        passes += 1
+
+    if data is None:
+        # nenhuma passada coube no alvo: fica o menor arquivo da última
+        save_fmt, resolved_kwargs = resolve_save_kwargs(fmt, save_kwargs)
+        buf = encode_buffers(_BATCH)[0]
+        size = bytes_of_save(cur_img, save_fmt, buf, quality_min, resolved_kwargs)
+        data, q_used = buffer_bytes(buf, size), quality_min
+
+    if mozjpeg and fmt in ("JPEG", "JPG"):
+        # só depois da busca: rodar o mozjpeg em cada sondagem custa ~4x o tempo
+        _, resolved_kwargs = resolve_save_kwargs(fmt, save_kwargs)
+        data, q_used = mozjpeg_raise_quality(cur_img, data, q_used, quality_max, target_bytes, resolved_kwargs)
+
+    # só o resultado final vai para o disco, uma única escrita
+    output_path.write_bytes(data)
+    return output_path, len(data) // 1024, cur_img.size, q_used
+
+
+def init_batch_worker():
+    # os processos já ocupam todos os núcleos; threads extras só disputariam CPU
+    global _MAX_WORKERS
+    _MAX_WORKERS = 1
+
+
+def compress_to_target_worker(job: tuple[Path, Path, dict]):
+    # um arquivo ruim não pode derrubar o lote: o erro volta como resultado,
+    # em texto porque nem toda exceção sobrevive ao pickle de volta
+    input_path, output_path, options = job
+    try:
+        return input_path, compress_to_target(input_path, output_path, **options), None
+    except Exception as exc:
+        return input_path, None, f"{type(exc).__name__}: {exc}"
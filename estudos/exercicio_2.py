@@ -17,7 +17,7 @@ idade = input('Digite sua idade: ')
 
 if nome and idade:
     print(f'Seu nome é {nome}')
-    print(f'Seu nome invertido é {nome[::-1]}')
+    print('Seu nome invertido é', ''.join(reversed(nome)))
     print(f'Seu nome tem {len(nome)} letras')
     print(f'A primeira letra do seu nome é {nome[0]}')
     print(f'A última letra do seu nome é {nome[-1]}')
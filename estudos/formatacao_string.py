@@ -11,10 +11,17 @@
 # Ex: 0>-100,.1f
 #conversion flags - !r !s !a __repr__ __str__ __ascii__
 
+import sys
+
 variavel = 'ABC'
-print(f'{variavel}')
-print(f'{variavel: >10}')
-print(f'{variavel: <10}')
-print(f'{variavel: ^10}')
-print(f'{1000.48756465:0=+10.1f}')
-print(f'O hexadecimal de 1500 é {1500:08X}')
+linhas = [
+    f'{variavel}',
+    f'{variavel: >10}',
+    f'{variavel: <10}',
+    f'{variavel: ^10}',
+    f'{1000.48756465:0=+10.1f}',
+    f'O hexadecimal de 1500 é {1500:08X}',
+]
+# junta tudo numa string só e faz um único write(); print(*linhas, sep='\n')
+# faria um write() por item, por separador e pelo end
+sys.stdout.write('\n'.join(linhas) + '\n')